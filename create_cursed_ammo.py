@@ -1,10 +1,27 @@
-import xml.etree.ElementTree as ET
+import argparse
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+from dataclasses import dataclass
+from io import BytesIO
 import re
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
-import xmltodict
-import shutil
+from typing import Dict, List, Tuple, Optional, Union
+from xml.sax.saxutils import escape
+from lxml import etree as ET
+from lxml.builder import E
+
+# Precompiled defName text lookup, reused for every def instead of re-parsing
+# the path string on each call.
+_XP_DEFNAME = ET.XPath('string(defName)', smart_strings=False)
+
+# AmmoSetDef names following the AmmoSet_<internal_name> convention, in
+# document order
+_XP_AMMOSET_NAMES = ET.XPath(
+    './/CombatExtended.AmmoSetDef/defName[starts-with(., "AmmoSet_")]/text()',
+    smart_strings=False,
+)
 
 # Configuration for variant creation
 # New keys supported per-variant:
@@ -56,26 +73,118 @@ VARIANT_CONFIGS = {
     }
 }
 
+# Leading byte-order mark some input files carry (occasionally more than once)
+_UTF8_BOM = b'\xef\xbb\xbf'
+
+# Matches the parenthetical variant tag in labels, e.g. "(AP)" or "(AP-I)"
+_PAREN_RE = re.compile(r'\([^)]*\)')
+
+# Matches the leading "Craft <number>" of recipe descriptions
+_CRAFT_RE = re.compile(r'(?i)(Craft\s+)\d+')
+
+
+
+@dataclass(frozen=True, slots=True)
+class VariantSpec:
+    """A VARIANT_CONFIGS entry normalized once for create_cursed_ammo_variant.
+    
+    Modifiers of 1000 or more are absolute values rather than multipliers.
+    The optional blunt, damage and produced-amount settings are None when the
+    config leaves them out.
+    """
+    variant_key: str
+    base_ammo_class: str
+    label_paren: str
+    texture_suffix: str
+    sharp_is_absolute: bool
+    sharp_value: float
+    blunt_is_absolute: bool
+    blunt_value: Optional[float]
+    damage_modifier: float
+    has_damage_types: bool
+    primary_damage: Optional[Tuple[str, float]]
+    secondary_damages: Tuple[Tuple[str, float], ...]
+    damage_type: Optional[str]
+    legacy_secondary_damage: Optional[Tuple[str, str]]
+    recipe_materials: Dict[str, float]
+    amount_produced_modifier: Optional[float]
+
+    @classmethod
+    def from_config(cls, variant_key: str, config: Dict) -> "VariantSpec":
+        """Build a spec from a raw VARIANT_CONFIGS entry."""
+        sharp = config.get('sharp_penetration_modifier', 1)
+        blunt = config.get('blunt_penetration_modifier')
+        amount = config.get('amount_produced_modifier')
+
+        # normalize `damage_types` to primary/secondary dicts
+        dmg_cfg = config.get('damage_types')
+        primary_cfg = {}
+        secondary_cfg = {}
+        if isinstance(dmg_cfg, dict) and ('primary' in dmg_cfg or 'secondary' in dmg_cfg):
+            primary_cfg = dmg_cfg.get('primary', {}) or {}
+            secondary_cfg = dmg_cfg.get('secondary', {}) or {}
+        elif isinstance(dmg_cfg, dict):
+            # flat dict -> treat as secondary damage entries
+            secondary_cfg = dmg_cfg
+
+        # only the first primary entry is used as the primary damage type
+        primary_damage = None
+        for dmg_name, mult in primary_cfg.items():
+            primary_damage = (dmg_name, float(mult))
+            break
+
+        # legacy single-entry `secondary_damage` is only honoured for EAC_Silver
+        legacy_secondary_damage = None
+        if variant_key == "EAC_Silver" and 'secondary_damage' in config:
+            legacy_secondary_damage = (
+                config['secondary_damage']['def'],
+                str(config['secondary_damage']['amount']),
+            )
+
+        return cls(
+            variant_key=variant_key,
+            base_ammo_class=config['base_ammo_class'],
+            label_paren=f"({config['label_short']})",
+            texture_suffix=config['texture_suffix'],
+            sharp_is_absolute=sharp >= 1000,
+            sharp_value=float(sharp),
+            blunt_is_absolute=isinstance(blunt, (int, float)) and blunt >= 1000,
+            blunt_value=float(blunt) if blunt is not None else None,
+            damage_modifier=float(config['damage_modifier']),
+            has_damage_types='damage_types' in config,
+            primary_damage=primary_damage,
+            secondary_damages=tuple((name, float(mult)) for name, mult in secondary_cfg.items()),
+            # `damage_type` is only a fallback when `damage_types` is absent
+            damage_type=config.get('damage_type') if 'damage_types' not in config else None,
+            legacy_secondary_damage=legacy_secondary_damage,
+            recipe_materials=config['recipe_materials'],
+            amount_produced_modifier=float(amount) if amount is not None else None,
+        )
+
+
+# Enabled variants, normalized once at import
+VARIANT_SPECS = {
+    variant_key: VariantSpec.from_config(variant_key, config)
+    for variant_key, config in VARIANT_CONFIGS.items()
+    if config.get('enabled', True)
+}
+
 
 def get_ammo_set_info(root: ET.Element, ammo_type: str) -> Optional[Tuple[str, str]]:
     """Extract internal ammo naming and AmmoSet defName from the input XML.
     
     Returns: (internal_ammo_name, ammo_set_def_name) or None if not found
     """
-    # Find the AmmoSetDef to extract both the internal naming and the set name
-    for ammo_set in root.findall('.//CombatExtended.AmmoSetDef'):
-        ammo_set_name = ammo_set.find('defName')
-        if ammo_set_name is None or not ammo_set_name.text:
-            continue
-        
-        # The AmmoSetDef name typically follows the pattern AmmoSet_<internal_name>
-        # e.g., AmmoSet_65x48mmCreedmoor
-        ammo_set_def = ammo_set_name.text
-        if ammo_set_def.startswith('AmmoSet_'):
-            internal_ammo_name = ammo_set_def.replace('AmmoSet_', '')
-            return internal_ammo_name, ammo_set_def
+    # Find the AmmoSetDef to extract both the internal naming and the set name.
+    # The AmmoSetDef name typically follows the pattern AmmoSet_<internal_name>
+    # e.g., AmmoSet_65x48mmCreedmoor
+    ammo_set_names = _XP_AMMOSET_NAMES(root)
+    if not ammo_set_names:
+        return None
     
-    return None
+    ammo_set_def = ammo_set_names[0]
+    internal_ammo_name = ammo_set_def.replace('AmmoSet_', '')
+    return internal_ammo_name, ammo_set_def
 
 
 def get_ammo_caliber_name(filename: str) -> str:
@@ -83,96 +192,186 @@ def get_ammo_caliber_name(filename: str) -> str:
     return filename.replace('.xml', '')
 
 
-def find_ap_ammo_def(root: ET.Element, ammo_type: str, base_ammo_class: str) -> Optional[ET.Element]:
-    """Find AP or AP-I ammo definition in the XML based on base_ammo_class."""
-    # First try exact match with filename-based ammo_type
-    for ammo_def in root.findall('.//ThingDef[@Class="CombatExtended.AmmoDef"]'):
-        def_name = ammo_def.find('defName')
-        ammo_class_elem = ammo_def.find('ammoClass')
-        if (def_name is not None and def_name.text and 
-            def_name.text.startswith(f"Ammo_{ammo_type}_") and
-            ammo_class_elem is not None and ammo_class_elem.text == base_ammo_class):
-            return ammo_def
-    
-    # If no exact match, just find any ammo with the matching base_ammo_class
-    # This handles cases where internal naming differs from filename
-    for ammo_def in root.findall('.//ThingDef[@Class="CombatExtended.AmmoDef"]'):
-        def_name = ammo_def.find('defName')
-        ammo_class_elem = ammo_def.find('ammoClass')
-        if (def_name is not None and def_name.text and 
-            def_name.text.startswith("Ammo_") and
-            ammo_class_elem is not None and ammo_class_elem.text == base_ammo_class):
-            return ammo_def
+def is_source_def(elem: ET.Element) -> bool:
+    """Return True if a top-level def can feed variant creation or patching."""
+    if elem.tag in ('RecipeDef', 'CombatExtended.AmmoSetDef'):
+        return True
+    if elem.tag != 'ThingDef':
+        return False
+    if elem.get('Class') == 'CombatExtended.AmmoDef':
+        return True
+    return elem.get('ParentName') is not None and elem.find('projectile') is not None
+
+
+def parse_input_defs(input_path: Path) -> ET.Element:
+    """Parse an input XML file, keeping only the defs that is_source_def accepts.
     
-    return None
+    The file is streamed with iterparse and every other top-level def is
+    dropped as soon as it has been read, so only the useful subset stays in
+    memory. Comments and insignificant whitespace are dropped as well so the
+    copied defs can be re-indented cleanly.
+    """
+    data = input_path.read_bytes()
+    # Remove any BOMs that might be present; libxml2 only skips a single one
+    while data.startswith(_UTF8_BOM):
+        data = data[len(_UTF8_BOM):]
+    
+    root = None
+    for _, elem in ET.iterparse(BytesIO(data), events=('end',),
+                                remove_blank_text=True, remove_comments=True):
+        parent = elem.getparent()
+        if parent is None:
+            root = elem
+        elif parent.getparent() is None and not is_source_def(elem):
+            parent.remove(elem)
+    return root
+
+
+def index_defs(root: ET.Element) -> Tuple[Dict[str, List[ET.Element]], Dict[str, ET.Element], Dict[str, ET.Element]]:
+    """Walk the input XML once and index the defs needed for variant creation.
+    
+    Returns: (ammo_by_class, bullet_by_defname, recipe_by_defname) where
+    ammo_by_class maps an ammoClass to its AmmoDefs in document order. The
+    first def wins when a defName appears more than once.
+    """
+    ammo_by_class: Dict[str, List[ET.Element]] = {}
+    bullet_by_defname: Dict[str, ET.Element] = {}
+    recipe_by_defname: Dict[str, ET.Element] = {}
+    
+    for elem in root.iter('ThingDef', 'RecipeDef'):
+        def_name = _XP_DEFNAME(elem)
+        
+        if elem.tag == 'RecipeDef':
+            if def_name:
+                recipe_by_defname.setdefault(def_name, elem)
+            continue
+        
+        if elem.get('Class') == 'CombatExtended.AmmoDef':
+            ammo_class_elem = elem.find('ammoClass')
+            if ammo_class_elem is not None and ammo_class_elem.text:
+                ammo_by_class.setdefault(ammo_class_elem.text, []).append(elem)
+        
+        # Bullets are only usable if they actually carry projectile properties
+        if (def_name and elem.get('ParentName') is not None and
+            elem.find('projectile') is not None):
+            bullet_by_defname.setdefault(def_name, elem)
+    
+    return ammo_by_class, bullet_by_defname, recipe_by_defname
 
 
-def find_ap_bullet_def(root: ET.Element, def_name: str) -> Optional[ET.Element]:
-    """Find bullet projectile definition by linked ammo name."""
-    for bullet_def in root.findall('.//ThingDef[@ParentName]'):
-        bullet_name = bullet_def.find('defName')
-        if bullet_name is not None and bullet_name.text:
-            # Match bullet name to ammo name (Ammo_X_Y -> Bullet_X_Y)
-            expected_bullet_name = def_name.replace("Ammo_", "Bullet_")
-            if bullet_name.text == expected_bullet_name and bullet_def.find('projectile') is not None:
-                return bullet_def
-    return None
+def find_ap_ammo_def(ammo_by_class: Dict[str, List[ET.Element]], ammo_type: str, base_ammo_class: str) -> Optional[Tuple[ET.Element, str]]:
+    """Find AP or AP-I ammo definition in the XML based on base_ammo_class.
+    
+    Returns: (ammo def, its defName) or None if there is no match
+    """
+    # Prefer an exact match with the filename-based ammo_type; otherwise fall
+    # back to the first ammo with the matching base_ammo_class. This handles
+    # cases where internal naming differs from filename
+    fallback = None
+    for ammo_def in ammo_by_class.get(base_ammo_class, []):
+        def_name = _XP_DEFNAME(ammo_def)
+        if def_name.startswith(f"Ammo_{ammo_type}_"):
+            return ammo_def, def_name
+        if fallback is None and def_name.startswith("Ammo_"):
+            fallback = ammo_def, def_name
+    
+    return fallback
 
 
-def find_ap_recipe(root: ET.Element, def_name: str) -> Optional[ET.Element]:
-    """Find recipe definition by linked ammo name."""
-    expected_recipe_name = def_name.replace("Ammo_", "MakeAmmo_")
-    for recipe in root.findall('.//RecipeDef'):
-        recipe_name = recipe.find('defName')
-        if recipe_name is not None and recipe_name.text == expected_recipe_name:
-            return recipe
-    return None
+def child_index(element: ET.Element) -> Dict[str, ET.Element]:
+    """Map each child tag to its first child element, like repeated find(tag) calls."""
+    children: Dict[str, ET.Element] = {}
+    for child in element:
+        children.setdefault(child.tag, child)
+    return children
 
 
-def deep_copy_element(element: ET.Element) -> ET.Element:
-    """Create a deep copy of an XML element."""
-    return ET.fromstring(ET.tostring(element))
+def scale_rounded(text: str, factor: float) -> int:
+    """Scale a numeric def value by factor and round it to an integer.
+    
+    Plain integer sources (the common case) skip the float conversion, and a
+    factor of 1 skips the arithmetic entirely.
+    """
+    if text and text.lstrip('-').isdigit():
+        value = int(text)
+        return value if factor == 1 else round(value * factor)
+    return int(round(float(text) * factor))
 
 
-def create_cursed_ammo_variant(
-    root: ET.Element,
+def insert_after(parent: ET.Element, anchor: Optional[ET.Element], element: ET.Element) -> None:
+    """Insert element right after anchor, or at the end when there is no anchor."""
+    if anchor is None:
+        parent.append(element)
+    else:
+        parent.insert(parent.index(anchor) + 1, element)
+
+
+def swap_suffix(name: str, suffix: str) -> str:
+    """Replace the part of a defName after its last underscore with suffix."""
+    return f"{name.rsplit('_', 1)[0]}_{suffix}"
+
+
+def make_ingredient(material: str, count: Union[int, str]) -> ET.Element:
+    """Build a recipe ingredient entry (<li><filter><thingDefs>...</li>) for a material."""
+    return E.li(E.filter(E.thingDefs(E.li(material))), E.count(str(count)))
+
+
+def resolve_ap_defs(
+    ammo_by_class: Dict[str, List[ET.Element]],
+    bullet_by_defname: Dict[str, ET.Element],
+    recipe_by_defname: Dict[str, ET.Element],
     ammo_type: str,
-    variant_key: str,
-    config: Dict,
-    ammo_folder: str = "Rifle"
-) -> Tuple[Optional[ET.Element], Optional[ET.Element], Optional[ET.Element]]:
-    """Create cursed ammo variants (ammo def, bullet def, recipe) from AP types."""
+    base_ammo_class: str
+) -> Optional[Tuple[ET.Element, ET.Element, ET.Element]]:
+    """Find the base (ammo def, bullet def, recipe) for a base_ammo_class.
     
-    # Find the base AP definitions using the configured base_ammo_class
-    base_ammo_class = config['base_ammo_class']
-    ap_ammo = find_ap_ammo_def(root, ammo_type, base_ammo_class)
+    Returns None unless all three are present.
+    """
+    found = find_ap_ammo_def(ammo_by_class, ammo_type, base_ammo_class)
+    if found is None:
+        return None
     
-    if ap_ammo is None:
-        return None, None, None
+    # Linked defs follow the ammo name (Ammo_X_Y -> Bullet_X_Y / MakeAmmo_X_Y)
+    ap_ammo, ammo_def_name = found
+    ap_bullet = bullet_by_defname.get(ammo_def_name.replace("Ammo_", "Bullet_"))
+    ap_recipe = recipe_by_defname.get(ammo_def_name.replace("Ammo_", "MakeAmmo_"))
     
-    # Debug: print what we found
-    ammo_def_name = ap_ammo.find('defName').text
-    ap_bullet = find_ap_bullet_def(root, ammo_def_name)
-    ap_recipe = find_ap_recipe(root, ammo_def_name)
+    if ap_bullet is None or ap_recipe is None:
+        return None
     
-    if not (ap_ammo is not None and ap_bullet is not None and ap_recipe is not None):
-        return None, None, None
+    return ap_ammo, ap_bullet, ap_recipe
+
+
+def make_secondary_damage(entries: List[Tuple[str, Union[int, str]]]) -> ET.Element:
+    """Build a <secondaryDamage> list from (DamageDef, amount) pairs."""
+    return E.secondaryDamage(*(E.li(E('def', dmg_name), E.amount(str(amount))) for dmg_name, amount in entries))
+
+
+def create_cursed_ammo_variant(
+    ap_ammo: ET.Element,
+    ap_bullet: ET.Element,
+    ap_recipe: ET.Element,
+    ammo_type: str,
+    spec: VariantSpec,
+    ammo_folder: str = "Rifle"
+) -> Tuple[ET.Element, ET.Element, ET.Element]:
+    """Create cursed ammo variants (ammo def, bullet def, recipe) from AP types."""
+    
+    variant_key = spec.variant_key
+    label_paren = spec.label_paren
+    bullet_def_name = _XP_DEFNAME(ap_bullet)
     
     # Create cursed ammo definition
-    cursed_ammo = deep_copy_element(ap_ammo)
-    def_name_elem = cursed_ammo.find('defName')
-    if def_name_elem is not None:
-        old_name = def_name_elem.text
+    cursed_ammo = deepcopy(ap_ammo)
+    ammo_name_elem = cursed_ammo.find('defName')
+    if ammo_name_elem is not None:
         # Replace the variant type (AP, Incendiary, etc) with CursedVariant
-        # Find where the variant identifier starts (after the last underscore before the variant)
-        parts = old_name.split('_')
-        base = '_'.join(parts[:-1])  # Everything except the last part
-        new_name = f"{base}_{variant_key}"
-        def_name_elem.text = new_name
+        # (the variant identifier is everything after the last underscore)
+        ammo_name_elem.text = swap_suffix(ammo_name_elem.text, variant_key)
     
     label_elem = cursed_ammo.find('label')
     if label_elem is not None:
-        label_elem.text = f"{ammo_type} ({config['label_short']})"
+        label_elem.text = f"{ammo_type} {label_paren}"
     
     # Update ammoClass to the variant key
     ammo_class_elem = cursed_ammo.find('ammoClass')
@@ -182,65 +381,59 @@ def create_cursed_ammo_variant(
     # Update cookOffProjectile to point to the cursed bullet
     cookoff_elem = cursed_ammo.find('cookOffProjectile')
     if cookoff_elem is not None:
-        cursed_bullet_name = ap_bullet.find('defName').text
-        parts = cursed_bullet_name.split('_')
-        base = '_'.join(parts[:-1])
-        new_bullet_name = f"{base}_{variant_key}"
-        cookoff_elem.text = new_bullet_name
+        cookoff_elem.text = swap_suffix(bullet_def_name, variant_key)
     
     # Update texture path
     graphic_elem = cursed_ammo.find('.//graphicData/texPath')
     if graphic_elem is not None:
         # Build the texture path using the ammo folder from the file location
         # and the variant texture suffix
-        graphic_elem.text = f"Things/Ammo/{ammo_folder}/{config['texture_suffix']}"
+        graphic_elem.text = f"Things/Ammo/{ammo_folder}/{spec.texture_suffix}"
     
     # Create cursed bullet definition
-    cursed_bullet = deep_copy_element(ap_bullet)
+    cursed_bullet = deepcopy(ap_bullet)
     def_name_elem = cursed_bullet.find('defName')
     if def_name_elem is not None:
-        old_name = def_name_elem.text
         # Replace the variant type in bullet name (e.g., Bullet_X_AP -> Bullet_X_Variant)
-        parts = old_name.split('_')
-        base = '_'.join(parts[:-1])  # Everything except the last part
-        new_name = f"{base}_{variant_key}"
-        def_name_elem.text = new_name
+        def_name_elem.text = swap_suffix(def_name_elem.text, variant_key)
     
     label_elem = cursed_bullet.find('label')
     if label_elem is not None:
         # Replace (AP), (AP-I), or any similar parenthetical with the new label
-        label_elem.text = re.sub(r'\([^)]*\)', f'({config["label_short"]})', label_elem.text)
+        label_elem.text = _PAREN_RE.sub(label_paren, label_elem.text)
     
     # Update bullet projectile properties
     projectile = cursed_bullet.find('projectile')
     if projectile is not None:
+        # Index the projectile's children once; kept in sync as they change
+        kids = child_index(projectile)
+        
         # Update sharp penetration
-        penetration_elem = projectile.find('armorPenetrationSharp')
+        penetration_elem = kids.get('armorPenetrationSharp')
         if penetration_elem is not None:
             try:
-                old_value = float(penetration_elem.text)
                 # For Silver variant a very large modifier can be used to set an absolute value;
                 # otherwise treat as multiplier (round to int for sharp AP).
-                if config.get('sharp_penetration_modifier', 1) >= 1000:
-                    new_value = config['sharp_penetration_modifier']
+                if spec.sharp_is_absolute:
+                    # Parsed only so non-numeric values are skipped, as for multipliers
+                    float(penetration_elem.text)
+                    new_value = int(spec.sharp_value)
                 else:
-                    new_value = old_value * config.get('sharp_penetration_modifier', 1)
-                    new_value = round(new_value)
-                penetration_elem.text = str(int(new_value))
+                    new_value = scale_rounded(penetration_elem.text, spec.sharp_value)
+                penetration_elem.text = str(new_value)
             except (ValueError, TypeError):
                 pass
 
         # Update blunt penetration (new: supports blunt_penetration_modifier)
-        blunt_elem = projectile.find('armorPenetrationBlunt')
-        if blunt_elem is not None and 'blunt_penetration_modifier' in config:
+        blunt_elem = kids.get('armorPenetrationBlunt')
+        if blunt_elem is not None and spec.blunt_value is not None:
             try:
                 old_blunt = float(blunt_elem.text)
-                bm = config.get('blunt_penetration_modifier', 1.0)
                 # if user supplies a very large number treat it as absolute value; otherwise multiply
-                if isinstance(bm, (int, float)) and bm >= 1000:
-                    new_blunt = float(bm)
+                if spec.blunt_is_absolute:
+                    new_blunt = spec.blunt_value
                 else:
-                    new_blunt = old_blunt * float(bm)
+                    new_blunt = old_blunt * spec.blunt_value
                 # keep two decimal precision (trim trailing zeros)
                 new_text = f"{round(new_blunt, 2):.2f}".rstrip('0').rstrip('.')
                 blunt_elem.text = new_text
@@ -248,13 +441,12 @@ def create_cursed_ammo_variant(
                 pass
         
         # Update damage
-        damage_elem = projectile.find('damageAmountBase')
+        damage_elem = kids.get('damageAmountBase')
+        damage_value = None
         if damage_elem is not None:
             try:
-                old_value = float(damage_elem.text)
-                new_value = old_value * config['damage_modifier']
-                new_value = round(new_value)
-                damage_elem.text = str(int(new_value))
+                damage_value = scale_rounded(damage_elem.text, spec.damage_modifier)
+                damage_elem.text = str(damage_value)
             except (ValueError, TypeError):
                 pass
         
@@ -264,145 +456,89 @@ def create_cursed_ammo_variant(
         #    nested dict with optional 'primary' and 'secondary' sub-dicts:
         #      {'primary': {'Bullet': 1.2}, 'secondary': {'EMP': 0.5}}
         # Backwards-compatible: `damage_type` (single string) still works.
-        if 'damage_types' in config:
-            dmg_cfg = config['damage_types']
-
-            # get current base damage (after config['damage_modifier'] applied earlier)
-            damage_elem = projectile.find('damageAmountBase')
-            try:
-                base_damage = float(damage_elem.text) if damage_elem is not None else None
-            except (ValueError, TypeError):
-                base_damage = None
-
-            # normalize to primary/secondary dicts
-            primary_cfg = {}
-            secondary_cfg = {}
-            if isinstance(dmg_cfg, dict) and ('primary' in dmg_cfg or 'secondary' in dmg_cfg):
-                primary_cfg = dmg_cfg.get('primary', {}) or {}
-                secondary_cfg = dmg_cfg.get('secondary', {}) or {}
-            elif isinstance(dmg_cfg, dict):
-                # flat dict -> treat as secondary damage entries
-                secondary_cfg = dmg_cfg
+        if spec.has_damage_types:
+            # current base damage (after damage_modifier applied earlier)
+            base_damage = damage_value
 
             # Apply primary damage override (if provided)
-            if primary_cfg:
-                # use the first entry as the primary damage type
-                for dmg_name, mult in primary_cfg.items():
-                    # set or create damageDef element
-                    damage_def_elem = projectile.find('damageDef')
-                    if damage_def_elem is None:
-                        damage_def_elem = ET.Element('damageDef')
-                        # insert after damageAmountBase for ordering
-                        children = list(projectile)
-                        insert_pos = len(children)
-                        for i, child in enumerate(children):
-                            if child.tag == 'damageAmountBase':
-                                insert_pos = i + 1
-                                break
-                        projectile.insert(insert_pos, damage_def_elem)
-                    damage_def_elem.text = dmg_name
-
-                    # scale primary damageAmountBase by multiplier if possible
-                    if base_damage is not None:
-                        try:
-                            new_val = int(round(base_damage * float(mult)))
-                            damage_elem.text = str(new_val)
-                            base_damage = float(new_val)
-                        except (ValueError, TypeError):
-                            pass
-                    break
+            if spec.primary_damage is not None:
+                dmg_name, mult = spec.primary_damage
+                # set or create damageDef element
+                damage_def_elem = kids.get('damageDef')
+                if damage_def_elem is None:
+                    damage_def_elem = ET.Element('damageDef')
+                    # insert after damageAmountBase for ordering
+                    insert_after(projectile, damage_elem, damage_def_elem)
+                    kids['damageDef'] = damage_def_elem
+                damage_def_elem.text = dmg_name
+
+                # scale primary damageAmountBase by multiplier if possible
+                if base_damage is not None:
+                    base_damage = round(base_damage * mult)
+                    damage_elem.text = str(base_damage)
 
             # Apply secondary damage entries (replace existing secondaryDamage)
-            if secondary_cfg and base_damage is not None:
-                existing_sec = projectile.find('secondaryDamage')
+            if spec.secondary_damages and base_damage is not None:
+                existing_sec = kids.pop('secondaryDamage', None)
                 if existing_sec is not None:
                     projectile.remove(existing_sec)
 
-                sec_elem = ET.Element('secondaryDamage')
-                for dmg_name, mult in secondary_cfg.items():
-                    try:
-                        amt = int(round(base_damage * float(mult)))
-                    except (ValueError, TypeError):
-                        continue
-                    li = ET.Element('li')
-                    def_e = ET.Element('def')
-                    def_e.text = dmg_name
-                    li.append(def_e)
-                    amt_e = ET.Element('amount')
-                    amt_e.text = str(amt)
-                    li.append(amt_e)
-                    sec_elem.append(li)
-
+                sec_elem = make_secondary_damage([
+                    (dmg_name, int(round(base_damage * mult)))
+                    for dmg_name, mult in spec.secondary_damages
+                ])
                 if len(sec_elem):
                     projectile.append(sec_elem)
+                    kids['secondaryDamage'] = sec_elem
 
-        elif 'damage_type' in config:
-            damage_def_elem = projectile.find('damageDef')
+        elif spec.damage_type is not None:
+            damage_def_elem = kids.get('damageDef')
             if damage_def_elem is None:
                 # Create damageDef element if it doesn't exist
                 # Insert it right after damageAmountBase for proper ordering
                 damage_def_elem = ET.Element('damageDef')
-                damage_def_elem.text = config['damage_type']
-                # Find position after damageAmountBase
-                children = list(projectile)
-                insert_pos = len(children)
-                for i, child in enumerate(children):
-                    if child.tag == 'damageAmountBase':
-                        insert_pos = i + 1
-                        break
-                projectile.insert(insert_pos, damage_def_elem)
+                damage_def_elem.text = spec.damage_type
+                insert_after(projectile, damage_elem, damage_def_elem)
+                kids['damageDef'] = damage_def_elem
             else:
-                damage_def_elem.text = config['damage_type']
+                damage_def_elem.text = spec.damage_type
         
         # Backwards-compat for legacy `secondary_damage` config (EAC_Silver)
         # Do NOT remove any secondaryDamage produced by the generic `damage_types` flow.
-        if variant_key == "EAC_Silver" and 'secondary_damage' in config:
+        if spec.legacy_secondary_damage is not None:
             # Remove existing secondaryDamage and add the legacy entry
-            existing_sec = projectile.find('secondaryDamage')
+            existing_sec = kids.pop('secondaryDamage', None)
             if existing_sec is not None:
                 projectile.remove(existing_sec)
 
-            secondary_elem = ET.Element('secondaryDamage')
-            li_elem = ET.Element('li')
-
-            def_elem = ET.Element('def')
-            def_elem.text = config['secondary_damage']['def']
-            li_elem.append(def_elem)
-
-            amount_elem = ET.Element('amount')
-            amount_elem.text = str(config['secondary_damage']['amount'])
-            li_elem.append(amount_elem)
-
-            secondary_elem.append(li_elem)
+            secondary_elem = make_secondary_damage([spec.legacy_secondary_damage])
             projectile.append(secondary_elem)
+            kids['secondaryDamage'] = secondary_elem
     
     # Create cursed recipe definition
-    cursed_recipe = deep_copy_element(ap_recipe)
-    def_name_elem = cursed_recipe.find('defName')
+    cursed_recipe = deepcopy(ap_recipe)
+    recipe_kids = child_index(cursed_recipe)
+    def_name_elem = recipe_kids.get('defName')
     if def_name_elem is not None:
-        old_name = def_name_elem.text
         # Replace the variant type in recipe name
-        parts = old_name.split('_')
-        base = '_'.join(parts[:-1])  # Everything except the last part
-        new_name = f"{base}_{variant_key}"
-        def_name_elem.text = new_name
+        def_name_elem.text = swap_suffix(def_name_elem.text, variant_key)
     
-    label_elem = cursed_recipe.find('label')
+    label_elem = recipe_kids.get('label')
     if label_elem is not None:
         # Replace (AP), (AP-I), or any similar parenthetical with the new label
-        label_elem.text = re.sub(r'\([^)]*\)', f'({config["label_short"]})', label_elem.text)
+        label_elem.text = _PAREN_RE.sub(label_paren, label_elem.text)
     
     # Update description and jobString
-    description_elem = cursed_recipe.find('description')
+    description_elem = recipe_kids.get('description')
     if description_elem is not None:
-        description_elem.text = re.sub(r'\([^)]*\)', f'({config["label_short"]})', description_elem.text)
+        description_elem.text = _PAREN_RE.sub(label_paren, description_elem.text)
     
-    jobstring_elem = cursed_recipe.find('jobString')
+    jobstring_elem = recipe_kids.get('jobString')
     if jobstring_elem is not None:
-        jobstring_elem.text = re.sub(r'\([^)]*\)', f'({config["label_short"]})', jobstring_elem.text)
+        jobstring_elem.text = _PAREN_RE.sub(label_paren, jobstring_elem.text)
     
     # Update recipe ingredients
-    ingredients = cursed_recipe.find('ingredients')
+    ingredients = recipe_kids.get('ingredients')
     if ingredients is not None:
         # Get the original ingredient count to calculate proportions
         ingredient_elements = ingredients.findall('li')
@@ -411,7 +547,7 @@ def create_cursed_ammo_variant(
         first_ingredient_count = "82"  # Default fallback
         if ingredient_elements and ingredient_elements[0].find('count') is not None:
             try:
-                first_ingredient_count = ingredient_elements[0].find('count').text
+                first_ingredient_count = ingredient_elements[0].find('count').text or first_ingredient_count
             except (AttributeError, ValueError, TypeError):
                 pass
         
@@ -427,60 +563,32 @@ def create_cursed_ammo_variant(
                         pass
             
             # Remove all existing ingredients
-            for ing in list(ingredient_elements):
-                ingredients.remove(ing)
+            del ingredients[:]
             
             # Add new ingredients with calculated amounts
             materials_in_order = ["Bioferrite", "Uranium", "Steel"]
             for material in materials_in_order:
-                proportion = config['recipe_materials'][material]
+                proportion = spec.recipe_materials[material]
                 count = int(round(total_cost * proportion))
-                
-                new_ingredient = ET.Element('li')
-                filter_elem = ET.SubElement(new_ingredient, 'filter')
-                thing_defs = ET.SubElement(filter_elem, 'thingDefs')
-                li_def = ET.SubElement(thing_defs, 'li')
-                li_def.text = material
-                
-                count_elem = ET.SubElement(new_ingredient, 'count')
-                count_elem.text = str(count)
-                
-                ingredients.append(new_ingredient)
+                ingredients.append(make_ingredient(material, count))
         
         elif variant_key == "EAC_Silver":
             # Replace with Silver + 1 Shard
-            ingredient_list = list(ingredients.findall('li'))
-            for ing in ingredient_list:
-                ingredients.remove(ing)
+            del ingredients[:]
             
             # Add Silver
-            silver_ingredient = ET.Element('li')
-            filter_elem = ET.SubElement(silver_ingredient, 'filter')
-            thing_defs = ET.SubElement(filter_elem, 'thingDefs')
-            li_def = ET.SubElement(thing_defs, 'li')
-            li_def.text = "Silver"
-            count_elem = ET.SubElement(silver_ingredient, 'count')
-            count_elem.text = first_ingredient_count
-            ingredients.append(silver_ingredient)
+            ingredients.append(make_ingredient("Silver", first_ingredient_count))
             
             # Add Shard
-            shard_ingredient = ET.Element('li')
-            filter_elem = ET.SubElement(shard_ingredient, 'filter')
-            thing_defs = ET.SubElement(filter_elem, 'thingDefs')
-            li_def = ET.SubElement(thing_defs, 'li')
-            li_def.text = "Shard"
-            count_elem = ET.SubElement(shard_ingredient, 'count')
-            count_elem.text = "1"
-            ingredients.append(shard_ingredient)
+            ingredients.append(make_ingredient("Shard", 1))
     
     # Update fixedIngredientFilter
-    fixed_filter = cursed_recipe.find('fixedIngredientFilter')
+    fixed_filter = recipe_kids.get('fixedIngredientFilter')
     if fixed_filter is not None:
         thing_defs = fixed_filter.find('thingDefs')
         if thing_defs is not None:
             # Clear existing
-            for li in thing_defs.findall('li'):
-                thing_defs.remove(li)
+            del thing_defs[:]
             
             # Add new materials
             if variant_key == "EAC_Bioferrite":
@@ -488,15 +596,13 @@ def create_cursed_ammo_variant(
             else:  # EAC_Silver
                 materials = ["Silver", "Shard"]
             
-            for material in materials:
-                li_elem = ET.SubElement(thing_defs, 'li')
-                li_elem.text = material
+            thing_defs.extend(E.li(material) for material in materials)
     
     # Update product reference in recipe
-    products = cursed_recipe.find('products')
+    products = recipe_kids.get('products')
     if products is not None:
         # Get the new ammo name we created
-        new_ammo_name = cursed_ammo.find('defName').text
+        new_ammo_name = ammo_name_elem.text
 
         # Find and update the product element
         for product_elem in list(products):
@@ -513,11 +619,8 @@ def create_cursed_ammo_variant(
 
                 # Compute new produced amount using config (default = orig_count)
                 produced_count = orig_count
-                if produced_count is not None and 'amount_produced_modifier' in config:
-                    try:
-                        produced_count = int(round(produced_count * float(config['amount_produced_modifier'])))
-                    except Exception:
-                        pass
+                if produced_count is not None and spec.amount_produced_modifier is not None:
+                    produced_count = int(round(produced_count * spec.amount_produced_modifier))
 
                 # Add new element with the cursed ammo name
                 new_product = ET.SubElement(products, new_ammo_name)
@@ -525,73 +628,74 @@ def create_cursed_ammo_variant(
 
                 # Update recipe description to reflect new produced amount (if present)
                 if produced_count is not None:
-                    desc_elem = cursed_recipe.find('description')
+                    desc_elem = recipe_kids.get('description')
                     if desc_elem is not None and isinstance(desc_elem.text, str):
                         # Replace leading 'Craft <number>' if present using a callable
                         # to avoid escape-sequence/backreference issues.
                         def _replace_count(match):
                             return f"{match.group(1)}{produced_count}"
-                        desc_elem.text = re.sub(r'(?i)(Craft\s+)\d+', _replace_count, desc_elem.text)
+                        desc_elem.text = _CRAFT_RE.sub(_replace_count, desc_elem.text)
 
                 break
     
     return cursed_ammo, cursed_bullet, cursed_recipe
 
 
-def process_input_file(input_path: str, output_dir: str) -> Optional[Tuple[str, str]]:
+def process_input_file(input_path: Path, output_dir: Path) -> Optional[Tuple[str, str]]:
     """Process a single input XML file and create cursed variants.
     
     Returns: (internal_ammo_name, ammo_set_def_name) or None if failed
     """
     
     try:
-        # Read file content and remove BOM/leading bytes for clean XML parsing
-        with open(input_path, 'r', encoding='utf-8-sig') as file:
-            content = file.read()
-        
-        # Remove any Unicode BOM characters that might still be present
-        content = content.lstrip('\ufeff')
-        
-        # Parse the cleaned XML content
-        root = ET.fromstring(content)
+        # Parse the XML content, keeping only the defs we build variants from
+        root = parse_input_defs(input_path)
         
         # Get caliber name from filename
-        filename = os.path.basename(input_path)
+        filename = input_path.name
         ammo_type = get_ammo_caliber_name(filename)
         
         # Get the ammo folder from the input file path (e.g., "Rifle", "Pistol", "HighCaliber")
-        input_file_path = Path(input_path)
-        ammo_folder = input_file_path.parent.name
+        ammo_folder = input_path.parent.name
         
         # Get ammo set information for patch generation
         ammo_set_info = get_ammo_set_info(root, ammo_type)
         
-        # Create output document with only cursed variants
-        output_root = ET.Element('Defs')
+        # Index the source defs once; every variant then does dict lookups
+        ammo_by_class, bullet_by_defname, recipe_by_defname = index_defs(root)
         
-        # Try to create each variant
-        for variant_key, config in VARIANT_CONFIGS.items():
-            # skip disabled variants
-            if not config.get('enabled', True):
+        # Variants sharing a base_ammo_class reuse the same resolved source defs
+        resolved: Dict[str, Optional[Tuple[ET.Element, ET.Element, ET.Element]]] = {}
+        
+        # Build every variant before touching the output, so a failure part
+        # way through leaves the previous output file intact
+        generated: List[ET.Element] = []
+        for spec in VARIANT_SPECS.values():
+            if spec.base_ammo_class not in resolved:
+                resolved[spec.base_ammo_class] = resolve_ap_defs(
+                    ammo_by_class, bullet_by_defname, recipe_by_defname,
+                    ammo_type, spec.base_ammo_class
+                )
+            ap_defs = resolved[spec.base_ammo_class]
+            if ap_defs is None:
                 continue
-
-            cursed_ammo, cursed_bullet, cursed_recipe = create_cursed_ammo_variant(
-                root, ammo_type, variant_key, config, ammo_folder
-            )
             
-            if cursed_ammo is not None:
-                output_root.append(cursed_ammo)
-            if cursed_bullet is not None:
-                output_root.append(cursed_bullet)
-            if cursed_recipe is not None:
-                output_root.append(cursed_recipe)
+            generated.extend(create_cursed_ammo_variant(*ap_defs, ammo_type, spec, ammo_folder))
         
-        # Write output file to the appropriate subdirectory
-        output_path = os.path.join(output_dir, filename)
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        indent_tree(output_root)
-        tree = ET.ElementTree(output_root)
-        tree.write(output_path, encoding='utf-8', xml_declaration=True)
+        # Stream the output document (only cursed variants) straight to the
+        # appropriate subdirectory instead of building a second Defs tree.
+        # The subdirectory itself is created up front by main()
+        output_path = output_dir / filename
+        with open(output_path, 'wb') as output_file:
+            with ET.xmlfile(output_file, encoding='utf-8') as xf:
+                xf.write_declaration()
+                with xf.element('Defs'):
+                    for elem in generated:
+                        ET.indent(elem, space='\t', level=1)
+                        xf.write('\n\t', elem)
+                    xf.write('\n')
+            # Terminate the document with a newline after the root element
+            output_file.write(b'\n')
         
         print(f"[OK] Processed: {filename}")
         
@@ -606,6 +710,27 @@ def process_input_file(input_path: str, output_dir: str) -> Optional[Tuple[str,
     return None
 
 
+def load_build_cache(cache_path: Path) -> Dict[str, Dict]:
+    """Load the build record of each output file from the last run.
+    
+    Each entry holds the input and script mtimes (in ns) the output was built
+    from and its ammo set info. Returns an empty cache when the file is missing
+    or unreadable, which simply makes every input regenerate.
+    """
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as cache_file:
+            return {
+                key: {
+                    'input_mtime_ns': int(entry['input_mtime_ns']),
+                    'script_mtime_ns': int(entry['script_mtime_ns']),
+                    'ammo_set_info': tuple(entry['ammo_set_info']),
+                }
+                for key, entry in json.load(cache_file).items()
+            }
+    except (OSError, ValueError, TypeError, KeyError, AttributeError):
+        return {}
+
+
 def generate_patch_file(ammo_set_infos: List[Tuple[str, str]], output_base_dir: Path) -> None:
     """Generate a patch file to add cursed ammo types to their AmmoSets.
     
@@ -617,49 +742,57 @@ def generate_patch_file(ammo_set_infos: List[Tuple[str, str]], output_base_dir:
         print("[WARNING] No ammo set information collected, skipping patch file generation")
         return
     
-    # Create root patch element
-    patch_root = ET.Element('Patch')
+    # The patch has a fixed shape, so emit it directly instead of building and
+    # serializing a tree
+    buf = bytearray(b"<?xml version='1.0' encoding='utf-8'?>\n<Patch>\n")
     
     # For each ammo type, create operations to add its cursed variants
     for internal_ammo_name, ammo_set_def_name in sorted(ammo_set_infos):
-        # Create operation for this ammo set
-        operation = ET.Element('Operation')
-        operation.set('Class', 'PatchOperationAdd')
-        
-        # Set xpath to the ammoTypes element
-        xpath_elem = ET.Element('xpath')
-        xpath_elem.text = f'Defs/CombatExtended.AmmoSetDef[defName="{ammo_set_def_name}"]/ammoTypes'
-        operation.append(xpath_elem)
+        # Operation adding to the set's ammoTypes element
+        xpath = escape(f'Defs/CombatExtended.AmmoSetDef[defName="{ammo_set_def_name}"]/ammoTypes')
+        buf += f'\t<Operation Class="PatchOperationAdd">\n\t\t<xpath>{xpath}</xpath>\n\t\t<value>\n'.encode('utf-8')
         
-        # Create value element with the new ammo entries
-        value_elem = ET.Element('value')
+        # Add EAC_Bioferrite and EAC_Silver variants
+        for variant_key in ("EAC_Bioferrite", "EAC_Silver"):
+            ammo = f"Ammo_{internal_ammo_name}_{variant_key}"
+            bullet = f"Bullet_{internal_ammo_name}_{variant_key}"
+            buf += f'\t\t\t<{ammo}>{escape(bullet)}</{ammo}>\n'.encode('utf-8')
         
-        # Add EAC_Bioferrite variant
-        bioferrite_ammo = f"Ammo_{internal_ammo_name}_EAC_Bioferrite"
-        bioferrite_bullet = f"Bullet_{internal_ammo_name}_EAC_Bioferrite"
-        bioferrite_entry = ET.Element(bioferrite_ammo)
-        bioferrite_entry.text = bioferrite_bullet
-        value_elem.append(bioferrite_entry)
-        
-        # Add EAC_Silver variant
-        silver_ammo = f"Ammo_{internal_ammo_name}_EAC_Silver"
-        silver_bullet = f"Bullet_{internal_ammo_name}_EAC_Silver"
-        silver_entry = ET.Element(silver_ammo)
-        silver_entry.text = silver_bullet
-        value_elem.append(silver_entry)
-        
-        operation.append(value_elem)
-        patch_root.append(operation)
+        buf += b'\t\t</value>\n\t</Operation>\n'
+    
+    buf += b'</Patch>\n'
     
     # Write patch file
     patch_path = output_base_dir / 'AmmoSetAdd_EAC_Cursed.xml'
-    indent_tree(patch_root)
-    patch_tree = ET.ElementTree(patch_root)
-    patch_tree.write(str(patch_path), encoding='utf-8', xml_declaration=True)
+    patch_path.write_bytes(bytes(buf))
     
     print(f"[OK] Generated patch file: {patch_path}")
 
 
+def index_pngs(search_root: Path) -> Dict[str, Path]:
+    """Map every PNG file name under search_root to its first path found.
+    
+    Directories are scanned depth-first with os.scandir, a directory's own
+    files before its subdirectories, which is the order Path.rglob visits them.
+    """
+    png_index: Dict[str, Path] = {}
+    pending = [str(search_root)]
+    while pending:
+        subdirs = []
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.endswith('.png'):
+                        png_index.setdefault(entry.name, Path(entry.path))
+        except OSError:
+            continue
+        # Pop subdirectories in scan order
+        pending.extend(reversed(subdirs))
+    return png_index
+
+
 def create_texture_folders(workspace_root: Path, ammo_folders: set) -> None:
     """Create texture folders for all variants in all ammo types and copy matching PNGs.
 
@@ -668,20 +801,22 @@ def create_texture_folders(workspace_root: Path, ammo_folders: set) -> None:
     new folder. If the source PNG is not found a warning is printed; existing
     destination files are not overwritten.
     """
+    # Only the texture copy needs shutil, so keep it out of the pool workers
+    import shutil
+
     texture_base = workspace_root / "Textures" / "Things" / "Ammo"
 
-    for ammo_folder in ammo_folders:
-        for variant_key, config in VARIANT_CONFIGS.items():
-            # skip disabled variants
-            if not config.get('enabled', True):
-                continue
+    # Index the Textures tree once for the fallback lookups below
+    png_index = index_pngs(workspace_root / "Textures")
 
-            texture_path = texture_base / ammo_folder / config['texture_suffix']
+    for ammo_folder in ammo_folders:
+        for spec in VARIANT_SPECS.values():
+            texture_path = texture_base / ammo_folder / spec.texture_suffix
             texture_path.mkdir(parents=True, exist_ok=True)
             print(f"[OK] Created texture folder: {texture_path}")
 
             # Prefer a source PNG in the same ammo folder, then fall back to any match
-            src_png_name = f"{config['texture_suffix']}.png"
+            src_png_name = f"{spec.texture_suffix}.png"
             preferred_src = texture_base / ammo_folder / src_png_name
             src_path = None
 
@@ -689,13 +824,10 @@ def create_texture_folders(workspace_root: Path, ammo_folders: set) -> None:
                 src_path = preferred_src
             else:
                 # Search under Textures for a matching PNG (first match wins)
-                search_root = workspace_root / "Textures"
-                for p in search_root.rglob(src_png_name):
-                    src_path = p
-                    break
+                src_path = png_index.get(src_png_name)
 
             if src_path is None:
-                print(f"[WARN] Source texture not found for '{config['texture_suffix']}' (expected '{src_png_name}'). Skipping copy.")
+                print(f"[WARN] Source texture not found for '{spec.texture_suffix}' (expected '{src_png_name}'). Skipping copy.")
                 continue
 
             dest_png = texture_path / src_png_name
@@ -710,26 +842,14 @@ def create_texture_folders(workspace_root: Path, ammo_folders: set) -> None:
                 print(f"[ERROR] Failed to copy texture {src_path} -> {dest_png}: {e}")
 
 
-def indent_tree(elem, level=0):
-    """Add pretty-printing indentation to XML tree."""
-    indent = "\n" + level * "\t"
-    if len(elem):
-        if not elem.text or not elem.text.strip():
-            elem.text = indent + "\t"
-        if not elem.tail or not elem.tail.strip():
-            elem.tail = indent
-        for child in elem:
-            indent_tree(child, level + 1)
-        if not child.tail or not child.tail.strip():
-            child.tail = indent
-    else:
-        if level and (not elem.tail or not elem.tail.strip()):
-            elem.tail = indent
-
-
 def main():
     """Main function to process all input files."""
     
+    parser = argparse.ArgumentParser(description="Generate cursed ammo variants from Combat Extended ammo defs.")
+    parser.add_argument('--force', action='store_true',
+                        help="regenerate every output file, even if it is newer than its input")
+    args = parser.parse_args()
+    
     workspace_root = Path(__file__).parent
     input_base_dir = workspace_root / "Input"
     output_base_dir = workspace_root / "Output"
@@ -745,8 +865,14 @@ def main():
     print(f"Output directory: {output_base_dir}")
     print()
     
-    # Process all XML files recursively in the Input directory and its subfolders
-    xml_files = sorted(input_base_dir.glob("**/*.xml"))
+    # Process all XML files recursively in the Input directory and its subfolders.
+    # Output doesn't depend on the order (the patch file sorts its entries)
+    xml_files = [
+        Path(dir_path, file_name)
+        for dir_path, _, file_names in os.walk(input_base_dir)
+        for file_name in file_names
+        if file_name.endswith('.xml')
+    ]
     
     if not xml_files:
         print("No XML files found in input directory.")
@@ -755,29 +881,75 @@ def main():
     print(f"Found {len(xml_files)} ammo files to process\n")
     
     # Collect unique ammo folders from the input files
-    ammo_folders = set()
-    for input_file in xml_files:
-        ammo_folder = input_file.parent.name
-        ammo_folders.add(ammo_folder)
+    ammo_folders = {input_file.parent.name for input_file in xml_files}
     
     # Create texture folders for all variants
     print("Creating texture folders...")
     create_texture_folders(workspace_root, ammo_folders)
     print()
     
-    # Collect ammo set information for patch file generation
-    ammo_set_infos = []
+    # Create every output subdirectory once, rather than once per file
+    output_subdirs = {output_base_dir / f.relative_to(input_base_dir).parent for f in xml_files}
+    for output_subdir in output_subdirs:
+        output_subdir.mkdir(parents=True, exist_ok=True)
+    
+    # Build record per output file (keyed by path relative to Output) from the
+    # previous run, so skipped inputs still end up in the patch file
+    cache_path = output_base_dir / ".cursed_cache.json"
+    build_cache = {} if args.force else load_build_cache(cache_path)
     
+    # Outputs built by a different version of this script are stale as well
+    script_mtime_ns = Path(__file__).stat().st_mtime_ns
+    
+    cache_keys = []
+    pending_inputs = []
+    pending_subdirs = []
+    pending_keys = []
     for input_file in xml_files:
         # Get the relative path from Input directory
         relative_path = input_file.relative_to(input_base_dir)
+        cache_key = relative_path.as_posix()
+        cache_keys.append(cache_key)
         # Create corresponding output subdirectory
         output_subdir = output_base_dir / relative_path.parent
         
-        # Process file and collect ammo set info
-        ammo_set_info = process_input_file(str(input_file), str(output_subdir))
-        if ammo_set_info:
-            ammo_set_infos.append(ammo_set_info)
+        # Reuse outputs whose cache entry was recorded for exactly this input
+        # and script. Comparing the recorded mtimes rather than the output's
+        # own mtime means an output rewritten by an interrupted run (which
+        # never saved its cache entry) is not mistaken for an up-to-date one
+        input_mtime_ns = input_file.stat().st_mtime_ns
+        entry = build_cache.pop(cache_key, None)
+        if (entry is not None and entry['input_mtime_ns'] == input_mtime_ns and
+                entry['script_mtime_ns'] == script_mtime_ns and
+                (output_subdir / input_file.name).exists()):
+            build_cache[cache_key] = entry
+            print(f"[SKIP] Up to date: {input_file.name}")
+            continue
+        
+        pending_inputs.append(input_file)
+        pending_subdirs.append(output_subdir)
+        pending_keys.append((cache_key, input_mtime_ns))
+    
+    # Each input file is parsed, transformed and written independently, so
+    # spread them across worker processes in batches to cut dispatch overhead
+    if pending_inputs:
+        with ProcessPoolExecutor() as executor:
+            # Process files and collect ammo set info
+            results = executor.map(process_input_file, pending_inputs, pending_subdirs, chunksize=8)
+            for (cache_key, input_mtime_ns), ammo_set_info in zip(pending_keys, results):
+                # Failed files are left out of the cache so they are retried
+                if ammo_set_info:
+                    build_cache[cache_key] = {
+                        'input_mtime_ns': input_mtime_ns,
+                        'script_mtime_ns': script_mtime_ns,
+                        'ammo_set_info': ammo_set_info,
+                    }
+        
+        with open(cache_path, 'w', encoding='utf-8') as cache_file:
+            json.dump(build_cache, cache_file, indent='\t', sort_keys=True)
+    
+    # Collect ammo set information for patch file generation
+    ammo_set_infos = [build_cache[key]['ammo_set_info'] for key in cache_keys if key in build_cache]
     
     # Generate patch file with all collected ammo set information
     generate_patch_file(ammo_set_infos, output_base_dir)
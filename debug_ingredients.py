@@ -1,12 +1,12 @@
-import xml.etree.ElementTree as ET
+from copy import deepcopy
 
-# Parse a sample recipe
+from lxml import etree as ET
+
+# Stream a sample file's recipes
 input_file = "Input/Rifle/127x55mm.xml"
-tree = ET.parse(input_file)
-root = tree.getroot()
 
 # Find Incendiary recipe
-for recipe in root.findall('.//RecipeDef'):
+for _, recipe in ET.iterparse(input_file, tag='RecipeDef'):
     def_name = recipe.find('defName')
     if def_name is not None and def_name.text == "MakeAmmo_127x55mm_Incendiary":
         print(f"Found recipe: {def_name.text}")
@@ -34,13 +34,12 @@ for recipe in root.findall('.//RecipeDef'):
             print(f"Total cost: {total_cost}")
             
             # Make a copy and test removal
-            recipe_copy = ET.fromstring(ET.tostring(recipe))
+            recipe_copy = deepcopy(recipe)
             ingredients_copy = recipe_copy.find('ingredients')
             ingredient_elements_copy = ingredients_copy.findall('li')
             print(f"Copy has {len(ingredient_elements_copy)} ingredients")
             
-            for ing in ingredient_elements_copy:
-                ingredients_copy.remove(ing)
+            del ingredients_copy[:]
             print(f"After removal: {len(ingredients_copy.findall('li'))} ingredients")
             
             # Add new ones
@@ -61,3 +60,6 @@ for recipe in root.findall('.//RecipeDef'):
                 print(f"  Material={mat.text if mat is not None else 'None'}, Count={count.text if count is not None else 'None'}")
         
         break
+    
+    # Free recipes that have already been checked
+    recipe.clear()